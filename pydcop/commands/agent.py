@@ -49,6 +49,7 @@ Synopsis
                [--uiport <start_uiport>]
                [--restart]
                [--delay <delay>]
+               [--reuseport]
 
 
 Description
@@ -60,7 +61,8 @@ The orchestrator might be started after or before the agents, if it is not
 reachable when starting the agents, they will wait until it is available.
 
 All agents are started in the same process and communicate with one another
-using an embedded http server (each agent has its own http server). You can
+using an embedded http server, shared by all the agents of the process (
+incoming messages are routed to the right agent). You can
 run this command several time on different machines, all pointing to the same
 orchestrator ; this allows to run large distributed systems.
 
@@ -95,9 +97,9 @@ Options
   If not given we try to use the primary IP address.
 
 ``-p <start_port>`` / ``--port <start_port>``
-  The port on which the agent will listen for messages. If several agents
-  names are started (when giving several names) this port is used for the
-  first agent and increment for each subsequent agent. Defaults to 9001
+  The port on which the agent(s) will listen for messages. All the agents
+  started by one command share a single http server, and thus a single
+  port. Defaults to 9001
 
 ``-i <start_uiport>`` / ``--uiport <start_uiport>``
   The port on which the ui-server will be listening (same behavior as
@@ -114,6 +116,12 @@ Options
   observe (for example with the GUI) the behavior of the algorithm at
   runtime.
 
+``--reuseport``
+  Bind several listening sockets on the agents' port, using SO_REUSEPORT :
+  the kernel balances incoming connections over their accept queues. Only
+  useful when many remote agents send to this host ; requires a platform
+  with SO_REUSEPORT support (e.g. Linux).
+
 
 
 
@@ -127,7 +135,7 @@ Running a single agent on port 9001, with an ui-server on port 10001::
 
     pydcop -v 3 agent -n a1 --orchestrator 127.0.0.1:9000 --uiport 10001
 
-Running 5 agents, listening on port 9011 - 9016 (without ui-server)::
+Running 5 agents, all listening on port 9011 (without ui-server)::
 
     pydcop -v 3 agent -n a1 a2 a3 a4 a5 -p 9011 --orchestrator 127.0.0.1:9000
 
@@ -135,16 +143,71 @@ Running 5 agents, listening on port 9011 - 9016 (without ui-server)::
 """
 
 import logging
-from time import sleep
+import random
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
 from typing import List
 
 from pydcop.dcop.objects import AgentDef
 from pydcop.infrastructure.orchestratedagents import OrchestratedAgent
-from pydcop.infrastructure.communication import HttpCommunicationLayer
+from pydcop.infrastructure.communication import SharedHttpCommunicationLayer
 
 logger = logging.getLogger("pydcop.cli.agent")
-force_stopped = False
+# Set on force exit : interrupts restart waits immediately instead of
+# letting them run their full duration.
+shutdown_event = Event()
+# The current cohort of agents. Accessed both from the main thread (which
+# re-assigns it on every restart cycle) and from the force-exit signal
+# handler : all accesses must hold _agents_lock.
 agents = []
+_agents_lock = Lock()
+_run_pool = None
+_spawn_pool = None
+# Number of SO_REUSEPORT listening sockets bound when --reuseport is given.
+_REUSEPORT_LISTENERS = 4
+# Bound on the number of threads used to create and start agents : spawning
+# is a short-lived task, a few workers are enough to overlap the cohort's
+# startup and their stacks are the only memory the pool retains.
+_SPAWN_POOL_SIZE = 8
+# AgentDef instances, interned by agent name : with --restart the same
+# definitions are needed on every cycle, AgentDef is immutable and can be
+# reused instead of being re-allocated and collected each time.
+_agent_defs = {}
+
+
+def _agents_run_pool(size: int) -> ThreadPoolExecutor:
+    """
+    Shared executor for the agents' run loops.
+
+    The pool is created on first use and reused for subsequent cohorts
+    (with ``--restart``, agents are re-created on every cycle) : threads
+    are recycled instead of being destroyed and re-spawned for each cycle.
+    A run loop occupies a worker for the whole life of its agent, so the
+    pool is sized on the cohort.
+    """
+    global _run_pool
+    if _run_pool is None:
+        _run_pool = ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="agent_run"
+        )
+    return _run_pool
+
+
+def _agents_spawn_pool() -> ThreadPoolExecutor:
+    """
+    Shared bounded executor for creating and starting agents.
+
+    Like the run pool, it is created on first use and reused across
+    restart cycles, so repeated restarts use a fixed set of threads
+    instead of growing and discarding thread stacks on every cycle.
+    """
+    global _spawn_pool
+    if _spawn_pool is None:
+        _spawn_pool = ThreadPoolExecutor(
+            max_workers=_SPAWN_POOL_SIZE, thread_name_prefix="agent_spawn"
+        )
+    return _spawn_pool
 
 
 def set_parser(subparsers):
@@ -216,6 +279,15 @@ def set_parser(subparsers):
         "want to observe (for example with the UI) the "
         "behavior of the algorithm at runtime",
     )
+    parser.add_argument(
+        "--reuseport",
+        action="store_true",
+        default=False,
+        help="Bind several listening sockets on the agents' "
+        "port with SO_REUSEPORT, letting the kernel "
+        "balance incoming connections over their accept "
+        "queues. Requires SO_REUSEPORT support (Linux).",
+    )
     parser.add_argument("--replication", default=False, action="store_true")
     parser.add_argument("--capacity", default=100, type=int)
 
@@ -226,51 +298,98 @@ def run_cmd(args):
         o_addr, o_port = args.orchestrator.split(":")
     else:
         o_addr, o_port = args.orchestrator, 9000
+    o_port = int(o_port)
+
+    # Resolve the orchestrator host once : every agent sends all its
+    # management messages to this address, and resolving it lazily would
+    # pay a getaddrinfo call in the message send path.
+    try:
+        infos = socket.getaddrinfo(o_addr, o_port, type=socket.SOCK_STREAM)
+        o_addr = infos[0][4][0]
+    except OSError:
+        logger.warning(
+            "Could not resolve orchestrator address %s, agents will "
+            "keep trying",
+            o_addr,
+        )
 
     names = list(args.names)
     if args.restart:
-        while not force_stopped:
-            agents = start_agents(
+        backoff = 1.0
+        while not shutdown_event.is_set():
+            cohort = start_agents(
                 names,
                 o_addr,
-                int(o_port),
+                o_port,
                 args.uiport,
                 args.address,
                 args.port,
                 args.delay,
                 args.replication,
                 args.capacity,
+                args.reuseport,
             )
+            with _agents_lock:
+                agents = cohort
 
             # block until all agents have finished
-            for agent in agents:
+            for agent in cohort:
                 agent.join()
             logger.info("All agents have stopped")
-            if force_stopped:
+            if shutdown_event.is_set():
                 break
-            logger.info("Wait before restarting")
-            sleep(10)
+            # Restart as soon as the orchestrator is reachable again,
+            # instead of always idling for a fixed delay. While it is not,
+            # back off exponentially (with jitter, so several agent
+            # processes do not probe in lockstep). Waiting on the event
+            # instead of sleeping makes shutdown immediate when the
+            # force-exit handler fires during the wait.
+            while not shutdown_event.is_set():
+                try:
+                    socket.create_connection((o_addr, o_port), timeout=1).close()
+                except OSError:
+                    logger.info(
+                        "Orchestrator not reachable, wait %.1fs before "
+                        "retrying",
+                        backoff,
+                    )
+                    shutdown_event.wait(backoff + random.uniform(0, backoff / 2))
+                    backoff = min(backoff * 2, 30)
+                else:
+                    logger.info("Orchestrator reachable, restarting agents")
+                    backoff = 1.0
+                    break
 
     else:
-        agents = start_agents(
+        cohort = start_agents(
             names,
             o_addr,
-            int(o_port),
+            o_port,
             args.uiport,
             args.address,
             args.port,
             args.delay,
             args.replication,
             args.capacity,
+            args.reuseport,
         )
+        with _agents_lock:
+            agents = cohort
 
 
 def on_force_exit(_, __):
     print("FORCE EXIT")
-    global agents, force_stopped
-    force_stopped = True
-    for agent in agents:
+    shutdown_event.set()
+    # Stop a snapshot of the cohort : the main thread may be re-assigning
+    # the agents list concurrently, during a restart cycle.
+    with _agents_lock:
+        cohort = list(agents)
+    for agent in cohort:
         agent.stop()
+    if _run_pool is not None:
+        _run_pool.shutdown(wait=False)
+    if _spawn_pool is not None:
+        _spawn_pool.shutdown(wait=False)
 
 
 def start_agents(
@@ -283,13 +402,15 @@ def start_agents(
     delay,
     replication,
     capacity,
+    reuseport=False,
 ):
     """
     Start orchestrated agents.
 
-    Each agent will run in its own thread, in the same process. They are
-    orchestrated by an orchestrator running in another process (which must be
-    launched separately).
+    Each agent will run in its own thread, in the same process. They all
+    share a single http server (and listening port) and a single outbound
+    http session. They are orchestrated by an orchestrator running in
+    another process (which must be launched separately).
 
     Parameters
     ----------
@@ -298,13 +419,15 @@ def start_agents(
     u_port: int
         start port for ui
     a_addr: str
-        IP address the agent will listen on
+        IP address the agents will listen on
     a_port: int
-        start port for agents (messages)
+        port the agents will listen on (messages)
     o_addr
         orchestrator address
     o_port
         orchestrator port
+    reuseport: bool
+        when True, bind several SO_REUSEPORT sockets on the agents' port
 
     Returns
     -------
@@ -312,39 +435,62 @@ def start_agents(
         the list of orchestrated agents started
 
     """
-    started_agents = []
-    for a in names:
-        if u_port:
-            logger.info(
-                "Starting agent {} on port {} with ui-server on {}".format(
-                    a, a_port, u_port
-                )
-            )
-        else:
-            logger.info(
-                "Starting agent {} on port {} without ui-server ".format(a, a_port)
-            )
+    # All agents of the process share a single http server (multiplexed on a
+    # single server loop) and a single outbound connection pool. Their run
+    # loops run on a shared thread pool, reused across restart cycles.
+    comm = SharedHttpCommunicationLayer(
+        (a_addr, a_port), listeners=_REUSEPORT_LISTENERS if reuseport else 1
+    )
+    run_pool = _agents_run_pool(len(names))
 
-        comm = HttpCommunicationLayer((a_addr, a_port))
-        agt_def = AgentDef(a, capacity=capacity)
+    def _spawn(a: str, agt_u_port):
+        # dict.setdefault is atomic : safe even though agents are spawned
+        # from several threads.
+        agt_def = _agent_defs.setdefault(a, AgentDef(a, capacity=capacity))
         if replication:
             agent = OrchestratedAgent(
                 agt_def,
-                comm,
+                comm.for_agent(a),
                 (o_addr, o_port),
-                ui_port=u_port,
+                ui_port=agt_u_port,
                 delay=delay,
                 replication="dist_ucs_hostingcosts",
+                thread_pool=run_pool,
             )
         else:
             agent = OrchestratedAgent(
-                agt_def, comm, (o_addr, o_port), ui_port=u_port, delay=delay
+                agt_def, comm.for_agent(a), (o_addr, o_port), ui_port=agt_u_port,
+                delay=delay, thread_pool=run_pool
             )
 
         agent.start()
-        started_agents.append(agent)
-        a_port += 1
-        if u_port:
-            u_port += 1
+        return agent
+
+    if u_port:
+        u_ports = [u_port + i for i in range(len(names))]
+    else:
+        u_ports = [None] * len(names)
+
+    # One batched log record instead of one formatted write per agent : the
+    # format work and the I/O are skipped entirely when INFO is disabled,
+    # which matters when restarting large cohorts in daemon mode.
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Starting agents on port %s:\n%s",
+            a_port,
+            "\n".join(
+                "  {} with ui-server on {}".format(a, p)
+                if p
+                else "  {} without ui-server".format(a)
+                for a, p in zip(names, u_ports)
+            ),
+        )
+
+    # Agents are created and started concurrently : creating an agent and
+    # its computations has a non-negligible cost, and doing it serially
+    # makes the startup time linear in the number of agents. The order of
+    # the returned agents still matches the order of `names`.
+    started_agents = list(_agents_spawn_pool().map(_spawn, names, u_ports))
+
     logger.info("All %s agents started", len(names))
     return started_agents
@@ -714,6 +714,18 @@ class AgentDef(SimpleRepr):
 
     """
 
+    # A system may contain thousands of AgentDef instances : with
+    # __slots__ they do not carry a per-instance __dict__, which
+    # significantly reduces their memory footprint.
+    __slots__ = (
+        "_name",
+        "_attr",
+        "_default_hosting_cost",
+        "_hosting_costs",
+        "_default_route",
+        "_routes",
+    )
+
     def __init__(
         self,
         name: str,
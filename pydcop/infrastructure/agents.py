@@ -46,6 +46,7 @@ import sys
 import threading
 import traceback
 import random
+from concurrent.futures import Executor, wait
 from functools import partial
 from importlib import import_module
 from threading import Thread
@@ -108,6 +109,13 @@ class Agent(object):
         runtime.
     daemon: boolean
         indicates if the agent should use a daemon thread (defaults to False)
+    thread_pool: concurrent.futures.Executor
+        an optional executor the agent's run loop will be submitted to,
+        instead of creating one dedicated thread per agent. As the run loop
+        occupies a worker for the whole life of the agent, the pool must
+        have at least as many workers as there are agents sharing it. A
+        shared pool is mostly useful to reuse threads when cohorts of agents
+        are started repeatedly in the same process.
 
     See Also
     --------
@@ -119,7 +127,8 @@ class Agent(object):
                  agent_def: AgentDef=None,
                  ui_port: int=None,
                  delay: float=None,
-                 daemon: bool=False):
+                 daemon: bool=False,
+                 thread_pool: Executor=None):
         self._name = name
         self.agent_def = agent_def
         self.logger = logging.getLogger('pydcop.agent.' + name)
@@ -137,8 +146,14 @@ class Agent(object):
         self._ui_port = ui_port
         self._ui_server = None
 
-        self.t = Thread(target=self._run, name='thread_'+name)
-        self.t.daemon = daemon
+        self._thread_pool = thread_pool
+        self._run_future = None
+        if thread_pool is None:
+            self.t = Thread(target=self._run, name='thread_'+name)
+            self.t.daemon = daemon
+        else:
+            # the run loop is submitted to the pool in start()
+            self.t = None
         self._stopping = threading.Event()
         self._shutdown = threading.Event()
         self._running = False
@@ -349,7 +364,10 @@ class Agent(object):
         self._running = True
         self.run_computations = run_computations
         self._start_t = perf_counter()
-        self.t.start()
+        if self._thread_pool is not None:
+            self._run_future = self._thread_pool.submit(self._run)
+        else:
+            self.t.start()
 
     def run(self, computations: Optional[Union[str, List[str]]]=None):
         """
@@ -587,7 +605,11 @@ class Agent(object):
         return self._running
 
     def join(self):
-        self.t.join()
+        if self._thread_pool is not None:
+            if self._run_future is not None:
+                wait([self._run_future])
+        else:
+            self.t.join()
 
     def _on_start(self):
         """
@@ -621,6 +643,10 @@ class Agent(object):
 
         self._computations[self.discovery.discovery_computation.name] = \
             self.discovery.discovery_computation
+        # Agents of a cohort start (and thus register) concurrently : use an
+        # exponential backoff with jitter between retries so they do not all
+        # hammer an unavailable directory in lockstep.
+        backoff = 0.5
         while True:
             # Check _stopping: do not prevent agent form stopping !
             if self._stopping.is_set():
@@ -632,7 +658,9 @@ class Agent(object):
             except UnreachableAgent:
                 self.logger.warning("Could not reach directory, will retry "
                                     "later")
-                sleep(1)
+                # Waiting on the event makes stop requests immediate.
+                self._stopping.wait(backoff + random.uniform(0, backoff / 2))
+                backoff = min(backoff * 2, 10)
             else:
                 break
         self.discovery.register_agent(self.name, self.address)
@@ -948,13 +976,17 @@ class ResilientAgent(Agent):
         only applies to algorithm's messages and is useful when you want to
         observe (for example with the GUI) the behavior of the algorithm at
         runtime.
+    thread_pool: concurrent.futures.Executor
+        an optional executor the agent's run loop will be submitted to (see
+        `Agent`).
 
     """
 
     def __init__(self, name: str, comm: CommunicationLayer,
                  agent_def: AgentDef, replication: str, ui_port=None,
-                 delay: float=None):
-        super().__init__(name, comm, agent_def, ui_port=ui_port, delay=delay)
+                 delay: float=None, thread_pool: Executor=None):
+        super().__init__(name, comm, agent_def, ui_port=ui_port, delay=delay,
+                         thread_pool=thread_pool)
         self.replication_comp = None
         if replication is not None:
             self.logger.debug('deploying replication computation %s',
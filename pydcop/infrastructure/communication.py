@@ -31,16 +31,18 @@
 
 import json
 import logging
+import selectors
 import socket
-from collections import namedtuple, defaultdict
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from collections import namedtuple, defaultdict, deque
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
 from json import JSONDecodeError
-from queue import Empty, PriorityQueue
-from threading import Thread
+from queue import Empty
+from threading import Event, Lock, Thread
 from time import perf_counter, sleep
 from typing import Tuple, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 
 from pydcop.infrastructure.discovery import UnknownComputation, UnknownAgent
@@ -310,6 +312,174 @@ def find_local_ip():
     return IP
 
 
+class _HttpServerLoop(object):
+    """
+    Multiplexes several http servers on a single thread.
+
+    Instead of dedicating one thread per http server, servers registered on
+    this loop are polled with a selector and their requests are all
+    dispatched from a single thread. This avoids spawning one server thread
+    per agent when many agents run in the same process, and thus removes the
+    corresponding context-switch and memory overhead.
+
+    As requests are dispatched sequentially from a single thread, handlers
+    must be fast and non-blocking, which is the case for
+    `MPCHttpHandler.do_POST` (messages are simply parsed and posted to the
+    target agent's message queue).
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._lock = Lock()
+        self._added = []
+        self._removed = []
+        self._thread = None
+
+    def register(self, httpd: HTTPServer):
+        """Register an http server on the loop.
+
+        The loop's thread is started lazily, when the first server is
+        registered.
+        """
+        with self._lock:
+            self._added.append(httpd)
+            if self._thread is None:
+                self._thread = Thread(
+                    name="http_loop", target=self._serve, daemon=True
+                )
+                self._thread.start()
+
+    def unregister(self, httpd: HTTPServer):
+        """Unregister a server ; it will not be polled any more."""
+        with self._lock:
+            if httpd in self._added:
+                self._added.remove(httpd)
+            else:
+                self._removed.append(httpd)
+
+    def _serve(self):
+        while True:
+            # Registrations are applied from the loop's thread, as selectors
+            # are not thread-safe.
+            with self._lock:
+                # Removals must be applied first : a server registered just
+                # after another one was closed may get the same file
+                # descriptor.
+                for httpd in self._removed:
+                    try:
+                        self._selector.unregister(httpd)
+                    except (KeyError, ValueError):
+                        # server socket already closed and removed
+                        pass
+                self._removed.clear()
+                for httpd in self._added:
+                    try:
+                        self._selector.register(httpd, selectors.EVENT_READ)
+                    except KeyError:
+                        # stale entry from a closed server with the same fd
+                        self._selector.unregister(httpd)
+                        self._selector.register(httpd, selectors.EVENT_READ)
+                self._added.clear()
+            events = self._selector.select(timeout=0.5)
+            for key, _ in events:
+                try:
+                    key.fileobj._handle_request_noblock()
+                except OSError:
+                    # the server might have been closed concurrently by
+                    # `HttpCommunicationLayer.shutdown`
+                    pass
+
+
+_server_loop = None  # type: Optional[_HttpServerLoop]
+_server_loop_lock = Lock()
+
+
+def _shared_server_loop() -> _HttpServerLoop:
+    """Process-level http server loop, created on first use."""
+    global _server_loop
+    with _server_loop_lock:
+        if _server_loop is None:
+            _server_loop = _HttpServerLoop()
+        return _server_loop
+
+
+_session = None  # type: Optional[requests.Session]
+_session_lock = Lock()
+
+
+def _http_session() -> requests.Session:
+    """
+    Process-level http session, created on first use.
+
+    The session maintains a pool of persistent (keep-alive) connections :
+    sending several messages to the same agent reuses an open connection
+    instead of paying a TCP handshake for every message.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount(
+                "http://", HTTPAdapter(pool_connections=32, pool_maxsize=256)
+            )
+            # Agent-to-agent traffic never goes through a proxy : with
+            # trust_env the session would scan the environment (proxy
+            # variables, netrc) on every single send.
+            _session.trust_env = False
+        return _session
+
+
+class _KeepAliveHttpServer(ThreadingHTTPServer):
+    """
+    Http server supporting persistent (keep-alive) connections.
+
+    Each connection is served by its own (daemon) thread, so that an open
+    persistent connection never blocks other clients ; only the `accept`
+    is performed from the server loop or thread. Persistent connections are
+    tracked and closed when the server is closed, otherwise their handler
+    thread could keep serving requests for a stale communication layer.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class):
+        super().__init__(server_address, handler_class)
+        self._conns = set()
+
+    def process_request(self, request, client_address):
+        self._conns.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        self._conns.discard(request)
+        super().shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for conn in list(self._conns):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            except OSError:
+                pass
+
+
+class _ReusePortHttpServer(_KeepAliveHttpServer):
+    """
+    Http server binding its port with SO_REUSEPORT.
+
+    Several of these servers can listen on the same port : the kernel
+    spreads incoming connections over their accept queues, so the
+    effective backlog grows with the number of listeners and a burst of
+    connections does not overflow a single queue. Only available on
+    platforms supporting SO_REUSEPORT (e.g. Linux).
+    """
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
 class HttpCommunicationLayer(CommunicationLayer):
     """
     This class implements the CommunicationLayer protocol.
@@ -329,12 +499,20 @@ class HttpCommunicationLayer(CommunicationLayer):
         Indicates how error when sending a message will be
         handled, possible value are 'ignore', 'retry', 'fail'
 
+    shared_server: bool
+        When True, the http server does not get its own thread : it is
+        registered on a single process-level server loop shared by all
+        HttpCommunicationLayer instances. This is useful when running many
+        agents in the same process (see the ``pydcop agent`` command),
+        as it avoids one extra thread per agent.
+
     """
 
     def __init__(
         self,
         address_port: Optional[Tuple[str, int]] = None,
         on_error: Optional[str] = "ignore",
+        shared_server: bool = False,
     ):
         super().__init__(on_error)
         if not address_port:
@@ -346,6 +524,7 @@ class HttpCommunicationLayer(CommunicationLayer):
             port = port if port else 9000
             self._address = ip_addr, port
 
+        self._shared_server = shared_server
         self.logger = logging.getLogger(
             "infrastructure.communication.HttpCommunicationLayer"
         )
@@ -353,7 +532,10 @@ class HttpCommunicationLayer(CommunicationLayer):
 
     def shutdown(self):
         self.logger.info("Shutting down HttpCommunicationLayer " "on %s", self.address)
-        self.httpd.shutdown()
+        if self._shared_server:
+            _shared_server_loop().unregister(self.httpd)
+        else:
+            self.httpd.shutdown()
         self.httpd.server_close()
 
     def _start_server(self):
@@ -363,7 +545,7 @@ class HttpCommunicationLayer(CommunicationLayer):
         )
         try:
             _, port = self._address
-            self.httpd = HTTPServer(("0.0.0.0", port), MPCHttpHandler)
+            self.httpd = _KeepAliveHttpServer(("0.0.0.0", port), MPCHttpHandler)
         except OSError:
             self.logger.error(
                 "Cannot bind http server on adress {}".format(self.address)
@@ -371,8 +553,13 @@ class HttpCommunicationLayer(CommunicationLayer):
             raise
         self.httpd.comm = self
 
-        t = Thread(name="http_thread", target=self.httpd.serve_forever, daemon=True)
-        t.start()
+        if self._shared_server:
+            _shared_server_loop().register(self.httpd)
+        else:
+            t = Thread(
+                name="http_thread", target=self.httpd.serve_forever, daemon=True
+            )
+            t.start()
 
     def on_post_message(self, path, sender, dest, msg: ComputationMessage):
         self.logger.debug("Http message received %s - %s %s", path, sender, dest)
@@ -403,67 +590,296 @@ class HttpCommunicationLayer(CommunicationLayer):
         :return:
         """
         on_error = on_error if on_error is not None else self._on_error
-        try:
-            server, port = self.discovery.agent_address(dest_agent)
-        except UnknownAgent:
-            return self._on_send_error(
-                src_agent, dest_agent, msg, on_error, UnknownAgent
-            )
+        return _http_send_msg(
+            self, _http_session(), src_agent, dest_agent, msg, on_error
+        )
 
-        dest_address = "http://{}:{}/pydcop".format(server, port)
-        msg_repr = simple_repr(msg.msg)
+    def __str__(self):
+        return "HttpCommunicationLayer({}:{})".format(*self._address)
+
+
+_dest_urls = {}  # type: Dict[Tuple[str, int], str]
+
+
+def _dest_url(server: str, port: int) -> str:
+    """
+    The http end-point url for an agent's address.
+
+    Urls are built once and cached : formatting one for every message would
+    put string-building on the message hot path.
+    """
+    try:
+        return _dest_urls[(server, port)]
+    except KeyError:
+        return _dest_urls.setdefault(
+            (server, port), "http://{}:{}/pydcop".format(server, port)
+        )
+
+
+def _http_send_msg(
+    comm: CommunicationLayer, poster, src_agent, dest_agent, msg, on_error
+):
+    """
+    Post a computation message to the http end-point of `dest_agent`.
+
+    `poster` is the object used to perform the http POST, it can be the
+    `requests` module itself or a `requests.Session` (to benefit from
+    connection pooling).
+    Errors are handled through `comm._on_send_error`, according to `on_error`.
+    """
+    try:
+        server, port = comm.discovery.agent_address(dest_agent)
+    except UnknownAgent:
+        return comm._on_send_error(src_agent, dest_agent, msg, on_error, UnknownAgent)
+
+    dest_address = _dest_url(server, port)
+    # Encode the body once : compact separators (no cosmetic whitespace)
+    # and an explicit utf-8 encode, instead of letting the http library
+    # re-serialize the message. The encoded bytes are reused as-is by the
+    # retry below.
+    body = json.dumps(simple_repr(msg.msg), separators=(",", ":")).encode("utf-8")
+    headers = {
+        "content-type": "application/json",
+        "sender-agent": src_agent,
+        "dest-agent": dest_agent,
+        "sender-comp": msg.src_comp,
+        "dest-comp": msg.dest_comp,
+        "type": str(msg.msg_type),
+    }
+    try:
+        r = poster.post(
+            dest_address,
+            headers=headers,
+            data=body,
+            timeout=0.5,
+            allow_redirects=False,
+        )
+    except ConnectionError:
+        # A pooled keep-alive connection may have been closed by the peer :
+        # retry once on a fresh connection before reporting an error.
         try:
-            r = requests.post(
+            r = poster.post(
                 dest_address,
-                headers={
-                    "sender-agent": src_agent,
-                    "dest-agent": dest_agent,
-                    "sender-comp": msg.src_comp,
-                    "dest-comp": msg.dest_comp,
-                    "type": str(msg.msg_type),
-                },
-                json=msg_repr,
+                headers=headers,
+                data=body,
                 timeout=0.5,
+                allow_redirects=False,
             )
         except ConnectionError:
             # Could not reach the target agent: connection refused or name
             # or service not known
-            return self._on_send_error(
+            return comm._on_send_error(
                 src_agent, dest_agent, msg, on_error, UnreachableAgent
             )
 
-        if r is not None and r.status_code == 404:
-            # It seems that the target computation of this message is not
-            # hosted on the agent
-            return self._on_send_error(
-                src_agent, dest_agent, msg, on_error, UnknownComputation
+    if r is not None and r.status_code == 404:
+        # It seems that the target computation of this message is not
+        # hosted on the agent
+        return comm._on_send_error(
+            src_agent, dest_agent, msg, on_error, UnknownComputation
+        )
+    return True
+
+
+class SharedHttpCommunicationLayer(object):
+    """
+    Shared http transport for several agents running in the same process.
+
+    Where `HttpCommunicationLayer` gives each agent its own http server (and
+    listening port), a SharedHttpCommunicationLayer is bound once to a single
+    address and port and routes incoming messages to the right agent, using
+    the `dest-agent` header set by the sending communication layer. All
+    agents also share a single outbound `requests.Session`, meaning one
+    connection pool for the whole process instead of one connection per
+    agent.
+
+    A SharedHttpCommunicationLayer is not itself a CommunicationLayer : use
+    `for_agent` to get a CommunicationLayer instance (for one agent) that
+    can be passed to an `Agent`. The server and session are released when
+    the last agent's communication layer is shut down.
+
+    Parameters
+    ----------
+    address_port: optional tuple (str, int)
+        The IP address and port this SharedHttpCommunicationLayer will be
+        listening on, with the same defaults as `HttpCommunicationLayer`.
+    on_error: str
+        default on_error behavior for the agents' communication layers.
+    listeners: int
+        number of listening sockets bound on the port. With more than one
+        listener, sockets are bound with SO_REUSEPORT and the kernel
+        balances incoming connections over their accept queues, which
+        helps when many remote agents connect to the same host. Ignored
+        (with a warning) on platforms without SO_REUSEPORT.
+    """
+
+    def __init__(
+        self,
+        address_port: Optional[Tuple[str, int]] = None,
+        on_error: Optional[str] = "ignore",
+        listeners: int = 1,
+    ):
+        self._on_error = on_error
+        if not address_port:
+            self._address = find_local_ip(), 9000
+        else:
+            ip_addr, port = address_port
+            ip_addr = ip_addr if ip_addr else find_local_ip()
+            ip_addr = ip_addr if ip_addr else "0.0.0.0"
+            port = port if port else 9000
+            self._address = ip_addr, port
+
+        self._agents = {}  # type: Dict[str, _AgentHttpAdapter]
+        self._session = _http_session()
+        self.logger = logging.getLogger(
+            "infrastructure.communication.SharedHttpCommunicationLayer"
+        )
+        if listeners > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            self.logger.warning(
+                "SO_REUSEPORT is not supported on this platform, using a "
+                "single listening socket"
             )
-        return True
+            listeners = 1
+        self._listeners = listeners
+        self._start_server()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """
+        The (ip, port) tuple messages can be sent to. All agents sharing
+        this layer are reachable at this single address.
+        """
+        return self._address
+
+    def for_agent(self, agt_name: str) -> "_AgentHttpAdapter":
+        """
+        Build a CommunicationLayer for the agent `agt_name`, backed by this
+        shared server and session.
+        """
+        comm = _AgentHttpAdapter(self, agt_name, self._on_error)
+        self._agents[agt_name] = comm
+        return comm
+
+    def on_post_message(self, path, sender, dest, msg: ComputationMessage):
+        self.logger.debug("Http message received %s - %s %s", path, sender, dest)
+        if dest is None and path.startswith("/agent/"):
+            dest = path[len("/agent/"):]
+        try:
+            comm = self._agents[dest]
+        except KeyError:
+            # Answered with a 404, exactly as when the target computation is
+            # not hosted on the agent.
+            raise UnknownComputation(
+                "No agent {} on shared communication layer {}".format(dest, self)
+            )
+        comm.messaging.post_msg(msg.src_comp, msg.dest_comp, msg.msg, msg.msg_type)
+
+    def _start_server(self):
+        self.logger.info(
+            "Starting shared http server for %s on %s",
+            list(self._agents),
+            self.address,
+        )
+        try:
+            _, port = self._address
+            if self._listeners > 1:
+                self._httpds = [
+                    _ReusePortHttpServer(("0.0.0.0", port), MPCHttpHandler)
+                    for _ in range(self._listeners)
+                ]
+            else:
+                self._httpds = [_KeepAliveHttpServer(("0.0.0.0", port), MPCHttpHandler)]
+        except OSError:
+            self.logger.error(
+                "Cannot bind http server on adress {}".format(self.address)
+            )
+            raise
+        self.httpd = self._httpds[0]
+        for httpd in self._httpds:
+            httpd.comm = self
+            _shared_server_loop().register(httpd)
+
+    def _release(self, agt_name: str):
+        # Called when an agent's communication layer is shut down : the
+        # server is only closed once no agent uses it any more.
+        self._agents.pop(agt_name, None)
+        if not self._agents:
+            self.shutdown()
+
+    def shutdown(self):
+        self.logger.info(
+            "Shutting down SharedHttpCommunicationLayer on %s", self.address
+        )
+        for httpd in self._httpds:
+            _shared_server_loop().unregister(httpd)
+            httpd.server_close()
 
     def __str__(self):
-        return "HttpCommunicationLayer({}:{})".format(*self._address)
+        return "SharedHttpCommunicationLayer({}:{})".format(*self._address)
+
+
+class _AgentHttpAdapter(CommunicationLayer):
+    """
+    CommunicationLayer view of a SharedHttpCommunicationLayer, for a single
+    agent.
+
+    Instances must be obtained with `SharedHttpCommunicationLayer.for_agent`.
+    """
+
+    def __init__(
+        self, shared: SharedHttpCommunicationLayer, agt_name: str, on_error=None
+    ):
+        super().__init__(on_error)
+        self._shared = shared
+        self._agt_name = agt_name
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._shared.address
+
+    def send_msg(
+        self, src_agent: str, dest_agent: str, msg: ComputationMessage, on_error=None
+    ):
+        """
+        Send msg from src_agent to dest_agent, through the shared session.
+        """
+        on_error = on_error if on_error is not None else self._on_error
+        return _http_send_msg(
+            self, self._shared._session, src_agent, dest_agent, msg, on_error
+        )
+
+    def shutdown(self):
+        self._shared._release(self._agt_name)
+
+    def __str__(self):
+        return "_AgentHttpAdapter({}, {}:{})".format(
+            self._agt_name, *self._shared.address
+        )
 
 
 class MPCHttpHandler(BaseHTTPRequestHandler):
+
+    # Speak http 1.1, so that clients sending through a session can keep
+    # their connection open between messages, instead of paying a full TCP
+    # handshake for every message.
+    protocol_version = "HTTP/1.1"
+    # Idle persistent connections are dropped after this delay, in seconds,
+    # releasing the thread that serves them.
+    timeout = 75
+
     def do_POST(self):
-        sender, dest = None, None
-        type = MSG_ALGO
-        if "sender-agent" in self.headers:
-            sender = self.headers["sender-agent"]
-        if "dest-agent" in self.headers:
-            dest = self.headers["dest-agent"]
-        src_comp, dest_comp = None, None
-        if "sender-comp" in self.headers:
-            src_comp = self.headers["sender-comp"]
-        if "dest-comp" in self.headers:
-            dest_comp = self.headers["dest-comp"]
-        if "type" in self.headers:
-            type = self.headers["type"]
+        sender = self.headers.get("sender-agent")
+        dest = self.headers.get("dest-agent")
+        src_comp = self.headers.get("sender-comp")
+        dest_comp = self.headers.get("dest-comp")
+        type = self.headers.get("type", MSG_ALGO)
 
         content_length = int(self.headers["Content-Length"])
         post_data = self.rfile.read(content_length)
         try:
-            content = json.loads(str(post_data, "utf-8"))
+            # json.loads accepts utf-8 bytes directly : no need to decode
+            # (i.e. copy) the payload into a str first.
+            content = json.loads(post_data)
         except JSONDecodeError as jde:
             print(jde)
             print(post_data)
@@ -479,12 +895,16 @@ class MPCHttpHandler(BaseHTTPRequestHandler):
             # the target computation.
             self.send_response(200)
             self.send_header("Content-type", "text/plain")
+            # With http 1.1, the content length is required to let the
+            # client know the (empty) response is complete.
+            self.send_header("Content-Length", "0")
             self.end_headers()
 
         except UnknownComputation as e:
             # if the requested computation is not hosted here
             self.send_response(404, str(e))
             self.send_header("Content-type", "text/plain")
+            self.send_header("Content-Length", "0")
             self.end_headers()
 
     def log_request(self, code="-", size="-"):
@@ -497,6 +917,68 @@ MSG_VALUE = 15
 MSG_ALGO = 20
 
 
+class _Mailbox(object):
+    """
+    Message queue of an agent, with one FIFO band per message type.
+
+    Several threads (the http server, other local agents) push messages
+    concurrently while only the agent's own thread pops them : a
+    multi-producer, single-consumer pattern. Messages are stored in one
+    deque per message type ; `deque.append` and `deque.popleft` are atomic
+    in CPython, so producers and the consumer never contend on a lock on
+    the hot path, where a `PriorityQueue` pays a mutex and a heap operation
+    for every message. An event is only used to park the consumer when all
+    bands are empty.
+
+    Delivery order is the same as with a priority queue on
+    (msg_type, counter) tuples : lower message types (e.g. `MSG_MGT`)
+    first, FIFO within a type.
+    """
+
+    def __init__(self):
+        self._bands = {}  # type: Dict[int, deque]
+        self._ready = Event()
+
+    def put(self, msg_type: int, t: float, msg):
+        try:
+            band = self._bands[msg_type]
+        except KeyError:
+            # Bands are created lazily, on the first message of each type.
+            # `setdefault` is atomic : even with concurrent producers a
+            # single deque is ever used for a given message type.
+            band = self._bands.setdefault(msg_type, deque())
+        band.append((t, msg))
+        self._ready.set()
+
+    def get(self, timeout: float = 0):
+        """
+        Pop the next message, as a (msg_type, t, msg) tuple.
+
+        Waits at most `timeout` seconds and raises `Empty` if no message
+        was received in time.
+        """
+        item = self._pop()
+        if item is None:
+            # Clearing the event before re-checking the bands ensures we
+            # cannot miss a message pushed in-between.
+            self._ready.clear()
+            item = self._pop()
+            if item is None and self._ready.wait(timeout):
+                item = self._pop()
+        if item is None:
+            raise Empty
+        return item
+
+    def _pop(self):
+        for msg_type in sorted(self._bands):
+            try:
+                t, msg = self._bands[msg_type].popleft()
+                return msg_type, t, msg
+            except IndexError:
+                continue
+        return None
+
+
 class Messaging(object):
     """
     A `Messaging` instance is responsible for all messaged-based communication
@@ -527,7 +1009,7 @@ class Messaging(object):
     """
 
     def __init__(self, agent_name: str, comm: CommunicationLayer, delay: float = None):
-        self._queue = PriorityQueue()
+        self._queue = _Mailbox()
         self._local_agent = agent_name
         self.discovery = comm.discovery
         self._comm = comm
@@ -578,7 +1060,7 @@ class Messaging(object):
 
     def next_msg(self, timeout: float = 0):
         try:
-            msg_type, _, t, full_msg = self._queue.get(block=True, timeout=timeout)
+            msg_type, t, full_msg = self._queue.get(timeout)
             if self._delay and msg_type == MSG_ALGO:
                 sleep(self._delay)
             return full_msg, t
@@ -659,14 +1141,11 @@ class Messaging(object):
             now = perf_counter()
             if msg_type != MSG_MGT:
                 self.last_msg_time = now
-            # When putting the message in the queue we add the type,
-            # a monotonic msg counter and the time of reception. As the queue
-            # is a priority queue, putting type and counter first ensure
-            # that the #  tuple will always be orderable. The time is
-            # useful to measure the delay between reception and handling
-            # of a message.
+            # The message is queued with its type (used as its priority
+            # level) and the time of reception, which is useful to measure
+            # the delay between reception and handling of a message.
             self.msg_queue_count += 1
-            self._queue.put((msg_type, self.msg_queue_count, now, full_msg))
+            self._queue.put(msg_type, now, full_msg)
         else:
             if self.logger.isEnabledFor(logging.DEBUG):
                 self.logger.debug(
@@ -30,6 +30,7 @@
 
 
 import logging
+from concurrent.futures import Executor
 from time import perf_counter
 from typing import Dict, List, Set
 
@@ -94,6 +95,9 @@ class OrchestratedAgent(ResilientAgent):
         only applies to algorithm's messages and is useful when you want to
         observe (for example with the GUI) the behavior of the algorithm at
         runtime.
+    thread_pool: concurrent.futures.Executor
+        an optional executor the agent's run loop will be submitted to (see
+        `Agent`).
 
     See Also
     --------
@@ -111,9 +115,11 @@ class OrchestratedAgent(ResilientAgent):
         replication: str = None,
         ui_port=None,
         delay: float = None,
+        thread_pool: Executor = None,
     ):
         super().__init__(
-            agt_def.name, comm, agt_def, replication, ui_port=ui_port, delay=delay
+            agt_def.name, comm, agt_def, replication, ui_port=ui_port, delay=delay,
+            thread_pool=thread_pool
         )
 
         # Orchestrator and orchestration computation hosted by it:
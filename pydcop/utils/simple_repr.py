@@ -84,6 +84,10 @@ class SimpleRepr(object):
 
 
     """
+    # No state of its own : allows subclasses to declare __slots__ and
+    # avoid carrying an instance __dict__.
+    __slots__ = ()
+
     def _simple_repr(self):
 
         # Full name = module + qualifiedname (for inner classes)
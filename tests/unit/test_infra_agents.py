@@ -29,6 +29,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 from unittest.mock import MagicMock
 
@@ -364,3 +365,25 @@ def test_remove_action(agent):
     mock1.reset_mock()
     sleep(0.5)
     mock1.assert_not_called()
+
+
+def test_start_stop_on_thread_pool():
+    # When given a thread pool, the agent's run loop is submitted to the
+    # pool instead of a dedicated thread.
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='agents')
+    agt1 = Agent('agt1', InProcessCommunicationLayer(), thread_pool=pool)
+    agt2 = Agent('agt2', InProcessCommunicationLayer(), thread_pool=pool)
+
+    agt1.start()
+    agt2.start()
+    assert agt1.is_running
+    assert agt2.is_running
+
+    agt1.stop()
+    agt2.stop()
+    agt1.join()
+    agt2.join()
+
+    assert not agt1.is_running
+    assert not agt2.is_running
+    pool.shutdown()
@@ -29,6 +29,7 @@
 # POSSIBILITY OF SUCH DAMAGE.
 
 
+import socket
 import unittest
 from http.server import HTTPServer
 from threading import Thread
@@ -40,7 +41,8 @@ import requests
 
 from pydcop.infrastructure.communication import Messaging, \
     InProcessCommunicationLayer, \
-    MPCHttpHandler, HttpCommunicationLayer, ComputationMessage, \
+    MPCHttpHandler, HttpCommunicationLayer, SharedHttpCommunicationLayer, \
+    ComputationMessage, \
     UnreachableAgent, MSG_MGT, UnknownAgent, UnknownComputation, MSG_ALGO
 from pydcop.infrastructure.computations import Message
 from pydcop.infrastructure.discovery import Discovery
@@ -101,6 +103,23 @@ class TestMessaging(object):
         with pytest.raises(UnknownComputation):
             local_messaging.post_msg('c3', 'c2', 'a msg')
 
+    def test_mgt_messages_are_delivered_first(self, local_messaging):
+        local_messaging.discovery.register_computation('c1', 'a1')
+        local_messaging.discovery.register_computation('c2', 'a1')
+
+        local_messaging.post_msg('c1', 'c2', 'algo1', MSG_ALGO)
+        local_messaging.post_msg('c1', 'c2', 'algo2', MSG_ALGO)
+        local_messaging.post_msg('c1', 'c2', 'mgt', MSG_MGT)
+
+        # The management message is delivered first, even though it was
+        # posted last ; algo messages keep their FIFO order.
+        (_, _, msg, _), _ = local_messaging.next_msg()
+        assert msg == 'mgt'
+        (_, _, msg, _), _ = local_messaging.next_msg()
+        assert msg == 'algo1'
+        (_, _, msg, _), _ = local_messaging.next_msg()
+        assert msg == 'algo2'
+
     def test_next_message_returns_None_when_no_msg(self, local_messaging):
         local_messaging.discovery.register_computation('c1', 'a1')
 
@@ -503,3 +522,176 @@ class TestHttpCommLayer(object):
         assert comm1.send_msg(
             'a1', 'a2',
             ComputationMessage('c1', 'c2', Message('a1', 't'), MSG_ALGO))
+
+
+@pytest.fixture
+def shared_server_comms():
+    comm1 = HttpCommunicationLayer(('127.0.0.1', 10011), shared_server=True)
+    comm1.discovery = Discovery('a1', ('127.0.0.1', 10011))
+    Messaging('a1', comm1)
+    comm1.messaging.post_msg = MagicMock()
+
+    comm2 = HttpCommunicationLayer(('127.0.0.1', 10012), shared_server=True)
+    comm2.discovery = Discovery('a2', ('127.0.0.1', 10012))
+    Messaging('a2', comm2)
+    comm2.messaging.post_msg = MagicMock()
+
+    yield comm1, comm2
+    comm1.shutdown()
+    comm2.shutdown()
+
+
+class TestHttpCommLayerSharedServer(object):
+    # When using shared_server=True, comm layers do not own a server
+    # thread : all their http servers are polled from a single
+    # process-level server loop.
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    def test_one_message_between_two(self, shared_server_comms):
+        comm1, comm2 = shared_server_comms
+
+        comm1.discovery.register_computation('c2', 'a2', ('127.0.0.1', 10012))
+        comm2.discovery.register_computation('c1', 'a1', ('127.0.0.1', 10011))
+
+        comm1.send_msg(
+            'a1', 'a2',
+            ComputationMessage('c1', 'c2', Message('test', 'test'), MSG_ALGO))
+
+        comm2.messaging.post_msg.assert_called_with(
+            'c1', 'c2', Message('test', 'test'), MSG_ALGO)
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    def test_messages_both_ways(self, shared_server_comms):
+        comm1, comm2 = shared_server_comms
+
+        comm1.discovery.register_computation('c2', 'a2', ('127.0.0.1', 10012))
+        comm2.discovery.register_computation('c1', 'a1', ('127.0.0.1', 10011))
+
+        comm1.send_msg(
+            'a1', 'a2',
+            ComputationMessage('c1', 'c2', Message('test', 'test1'), MSG_ALGO))
+        comm2.send_msg(
+            'a2', 'a1',
+            ComputationMessage('c2', 'c1', Message('test', 'test2'), MSG_ALGO))
+
+        comm2.messaging.post_msg.assert_called_with(
+            'c1', 'c2', Message('test', 'test1'), MSG_ALGO)
+        comm1.messaging.post_msg.assert_called_with(
+            'c2', 'c1', Message('test', 'test2'), MSG_ALGO)
+
+
+@pytest.fixture
+def shared_http_comms():
+    # Two agents sharing one http layer (one server, one port), plus a
+    # regular comm layer to talk to them from the 'outside'.
+    shared = SharedHttpCommunicationLayer(('127.0.0.1', 10021))
+    comm1 = shared.for_agent('a1')
+    comm1.discovery = Discovery('a1', ('127.0.0.1', 10021))
+    Messaging('a1', comm1)
+    comm1.messaging.post_msg = MagicMock()
+
+    comm2 = shared.for_agent('a2')
+    comm2.discovery = Discovery('a2', ('127.0.0.1', 10021))
+    Messaging('a2', comm2)
+    comm2.messaging.post_msg = MagicMock()
+
+    ext = HttpCommunicationLayer(('127.0.0.1', 10022))
+    ext.discovery = Discovery('a3', ('127.0.0.1', 10022))
+    Messaging('a3', ext)
+
+    yield comm1, comm2, ext
+    comm1.shutdown()
+    comm2.shutdown()
+    ext.shutdown()
+
+
+class TestSharedHttpCommLayer(object):
+
+    def test_agents_share_one_address(self, shared_http_comms):
+        comm1, comm2, _ = shared_http_comms
+
+        assert comm1.address == ('127.0.0.1', 10021)
+        assert comm1.address == comm2.address
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    def test_route_message_to_the_right_agent(self, shared_http_comms):
+        comm1, comm2, ext = shared_http_comms
+
+        # a1 and a2 are reachable at the same address, messages are routed
+        # with the dest-agent header.
+        ext.discovery.register_computation('c1', 'a1', ('127.0.0.1', 10021))
+        ext.discovery.register_computation('c2', 'a2', ('127.0.0.1', 10021))
+        ext.discovery.register_computation('c3', 'a3', ('127.0.0.1', 10022))
+
+        ext.send_msg(
+            'a3', 'a1',
+            ComputationMessage('c3', 'c1', Message('test', 'to_a1'), MSG_ALGO))
+        ext.send_msg(
+            'a3', 'a2',
+            ComputationMessage('c3', 'c2', Message('test', 'to_a2'), MSG_ALGO))
+
+        comm1.messaging.post_msg.assert_called_once_with(
+            'c3', 'c1', Message('test', 'to_a1'), MSG_ALGO)
+        comm2.messaging.post_msg.assert_called_once_with(
+            'c3', 'c2', Message('test', 'to_a2'), MSG_ALGO)
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    def test_msg_between_agents_on_shared_layer(self, shared_http_comms):
+        comm1, comm2, _ = shared_http_comms
+
+        comm1.discovery.register_computation('c2', 'a2', ('127.0.0.1', 10021))
+
+        comm1.send_msg(
+            'a1', 'a2',
+            ComputationMessage('c1', 'c2', Message('test', 'test'), MSG_ALGO))
+
+        comm2.messaging.post_msg.assert_called_with(
+            'c1', 'c2', Message('test', 'test'), MSG_ALGO)
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    def test_msg_to_unknown_agent_on_shared_layer(self, shared_http_comms):
+        comm1, comm2, ext = shared_http_comms
+
+        # a5 is not registered on the shared layer : the server answers 404
+        ext.discovery.register_computation('c5', 'a5', ('127.0.0.1', 10021))
+        ext.discovery.register_computation('c3', 'a3', ('127.0.0.1', 10022))
+
+        with pytest.raises(UnknownComputation):
+            ext.send_msg(
+                'a3', 'a5',
+                ComputationMessage('c3', 'c5', Message('test', 't'), MSG_ALGO),
+                on_error='fail')
+
+
+class TestSharedHttpCommLayerReusePort(object):
+
+    @pytest.mark.skipif(skip_http_tests(), reason='HTTP_TESTS == NO')
+    @pytest.mark.skipif(not hasattr(socket, 'SO_REUSEPORT'),
+                        reason='no SO_REUSEPORT on this platform')
+    def test_messages_with_several_listeners(self):
+        shared = SharedHttpCommunicationLayer(('127.0.0.1', 10031),
+                                              listeners=4)
+        comm1 = shared.for_agent('a1')
+        comm1.discovery = Discovery('a1', ('127.0.0.1', 10031))
+        Messaging('a1', comm1)
+        comm1.messaging.post_msg = MagicMock()
+
+        ext = HttpCommunicationLayer(('127.0.0.1', 10032))
+        ext.discovery = Discovery('a3', ('127.0.0.1', 10032))
+        Messaging('a3', ext)
+        try:
+            ext.discovery.register_computation(
+                'c1', 'a1', ('127.0.0.1', 10031))
+            ext.discovery.register_computation(
+                'c3', 'a3', ('127.0.0.1', 10032))
+
+            for i in range(4):
+                ext.send_msg(
+                    'a3', 'a1',
+                    ComputationMessage(
+                        'c3', 'c1', Message('test', i), MSG_ALGO))
+
+            assert comm1.messaging.post_msg.call_count == 4
+        finally:
+            comm1.shutdown()
+            ext.shutdown()